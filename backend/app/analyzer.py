@@ -1,68 +1,291 @@
 import librosa
 import numpy as np
-from typing import Dict, Any
+import soundfile as sf
+import scipy.fft
+import scipy.signal
+import scipy.sparse
+from numpy.lib.stride_tricks import sliding_window_view
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Any, Optional, Tuple
+import io
+import logging
+import math
 import tempfile
 import os
 
-def analyze_dynamics(y: np.ndarray, sr: int, n_fft: int, hop_length: int) -> Dict[str, Any]:
+logger = logging.getLogger(__name__)
+
+def time_weighting(levels: np.ndarray, alpha: float) -> np.ndarray:
+    """
+    沿最后一维做一阶指数时间加权（IIR平滑），首个输出等于首个输入
+
+    Args:
+        levels: 输入序列，可为多行
+        alpha: 平滑系数，exp(-hop_length / (time_constant * sr))
+
+    Returns:
+        时间加权后的序列
+    """
+    return scipy.signal.lfilter([1 - alpha], [1, -alpha], levels, axis=-1,
+                                zi=alpha * levels[..., :1])[0]
+
+@lru_cache(maxsize=8)
+def _hann_window(n_fft: int) -> np.ndarray:
+    """获取缓存的周期汉宁窗"""
+    return scipy.signal.get_window('hann', n_fft, fftbins=True).astype(np.float32)
+
+# 分块计算STFT时每块输出的最大字节数（参照librosa的MAX_MEM_BLOCK），
+# 避免一次性生成整个加窗帧矩阵
+STFT_BLOCK_BYTES = 2 ** 22
+
+def fast_stft(y: np.ndarray, n_fft: int, hop_length: int) -> np.ndarray:
+    """
+    计算短时傅里叶变换（汉宁窗，居中补零），结果与librosa.stft一致
+    按帧分块加窗并做FFT，峰值内存与librosa.stft相当
+
+    Args:
+        y: 音频数据
+        n_fft: FFT窗口大小
+        hop_length: 步长
+
+    Returns:
+        形状为(1 + n_fft // 2, 帧数)的C连续复数频谱
+    """
+    pad = n_fft // 2
+    n_frames = 1 + (len(y) + 2 * pad - n_fft) // hop_length
+    window = _hann_window(n_fft)
+    n_bins = 1 + n_fft // 2
+    D = np.empty((n_bins, n_frames), dtype=np.result_type(y.dtype, np.complex64))
+    block_frames = max(1, STFT_BLOCK_BYTES // (n_bins * D.itemsize))
+    for start in range(0, n_frames, block_frames):
+        stop = min(start + block_frames, n_frames)
+        # 取出本块帧覆盖的采样区间，只在信号两端按需补零
+        seg_start = start * hop_length - pad
+        seg_stop = (stop - 1) * hop_length - pad + n_fft
+        segment = y[max(seg_start, 0):min(seg_stop, len(y))]
+        if seg_start < 0 or seg_stop > len(y):
+            segment = np.pad(segment, (max(-seg_start, 0), max(seg_stop - len(y), 0)))
+        frames = sliding_window_view(segment, n_fft)[::hop_length] * window
+        # 单线程FFT：并行度来自同时运行的分析进程，避免每个进程都占满所有核心
+        D[:, start:stop] = scipy.fft.rfft(frames, axis=-1, overwrite_x=True).T
+    return D
+
+def power_spectrum(D: np.ndarray) -> np.ndarray:
+    """
+    计算功率谱 |D|^2，直接对实部和虚部求平方和，避免np.abs产生的中间数组
+
+    Args:
+        D: 复数频谱
+
+    Returns:
+        与D同形状的功率谱
+    """
+    S = np.multiply(D.real, D.real)
+    S += np.square(D.imag)
+    return S
+
+# 时域A加权的最低工作采样率：双线性变换在奈奎斯特频率附近压缩频响，
+# 在不低于4倍且不低于96kHz的采样率上滤波，0.9倍原奈奎斯特频率以内误差小于1dB
+MIN_OVERSAMPLED_RATE = 96000
+
+# 过采样A加权每次处理的输入采样点数，限制过采样中间数组的内存
+OVERSAMPLE_BLOCK_SAMPLES = 2 ** 16
+
+def _oversampling_factor(sr: int) -> int:
+    """获取时域A加权与真峰值测量使用的过采样倍数（至少4倍，符合ITU-R BS.1770）"""
+    return max(4, math.ceil(MIN_OVERSAMPLED_RATE / sr))
+
+@lru_cache(maxsize=8)
+def _oversampling_filter(factor: int) -> np.ndarray:
+    """获取过采样用的低通插值滤波器（每相32阶，0.9倍奈奎斯特频率处衰减小于0.1dB）"""
+    return scipy.signal.firwin(32 * factor, 1 / factor) * factor
+
+@lru_cache(maxsize=8)
+def _a_weighting_sos(sr: int) -> np.ndarray:
+    """
+    获取时域A加权滤波器（IEC 61672模拟原型经双线性变换），以二阶节形式表示
+
+    Args:
+        sr: 滤波器工作的采样率（应为过采样后的采样率）
+
+    Returns:
+        sos系数，已归一化为1kHz处增益0dB
+    """
+    f1, f2, f3, f4 = 20.598997, 107.65265, 737.86223, 12194.217
+    zeros = [0.0] * 4
+    poles = [-2 * np.pi * f for f in (f1, f1, f2, f3, f4, f4)]
+    gain = (2 * np.pi * f4) ** 2
+    sos = scipy.signal.zpk2sos(*scipy.signal.bilinear_zpk(zeros, poles, gain, sr))
+    _, h = scipy.signal.sosfreqz(sos, worN=[1000.0], fs=sr)
+    sos[0, :3] /= np.abs(h[0])
+    return sos
+
+def a_weighted_peak_and_power(y: np.ndarray, sr: int) -> Tuple[float, np.ndarray]:
+    """
+    在过采样信号上进行时域A加权，同时得到真峰值和逐采样点的A加权功率
+
+    Args:
+        y: 音频数据
+        sr: 采样率
+
+    Returns:
+        (A加权真峰值幅度, 每个原始采样点对应的过采样均方值，float32)
+    """
+    factor = _oversampling_factor(sr)
+    h = _oversampling_filter(factor)
+    sos = _a_weighting_sos(sr * factor)
+    zi = np.zeros((sos.shape[0], 2))
+    # 每块前附带的历史采样点数，保证分块插值与整体插值结果一致
+    history = math.ceil(len(h) / factor)
+    padded = np.concatenate([np.zeros(history, dtype=y.dtype), y])
+    
+    peak = 0.0
+    power = np.empty(len(y), dtype=np.float32)
+    for start in range(0, len(y), OVERSAMPLE_BLOCK_SAMPLES):
+        stop = min(start + OVERSAMPLE_BLOCK_SAMPLES, len(y))
+        up = scipy.signal.upfirdn(h, padded[start:stop + history], up=factor)
+        up = up[history * factor:(stop - start + history) * factor]
+        weighted, zi = scipy.signal.sosfilt(sos, up, zi=zi)
+        peak = max(peak, weighted.max(), -weighted.min())
+        weighted *= weighted
+        power[start:stop] = weighted.reshape(-1, factor).mean(axis=1)
+    return float(peak), power
+
+# 1/3倍频程中心频率（ISO标准）
+CENTER_FREQS = [
+    20, 25, 31.5, 40, 50, 63, 80, 100, 125, 160, 200, 250, 315, 400, 500,
+    630, 800, 1000, 1250, 1600, 2000, 2500, 3150, 4000, 5000, 6300, 8000,
+    10000, 12500, 16000, 20000
+]
+
+# 对数运算前的下限，使用float32常量避免数组被提升为float64
+EPSILON = np.float32(1e-10)
+
+# 动态范围统计使用的百分位数
+DYNAMICS_PERCENTILES = [10, 25, 50, 75, 90]
+
+def _to_db_inplace(x: np.ndarray, scale: float) -> np.ndarray:
+    """原地计算 scale * log10(max(x, EPSILON))，不产生中间数组"""
+    np.maximum(x, EPSILON, out=x)
+    np.log10(x, out=x)
+    x *= scale
+    return x
+
+def quantiles(a: np.ndarray, percentiles=DYNAMICS_PERCENTILES) -> np.ndarray:
+    """
+    沿最后一维用一次np.partition求百分位数（线性插值，与np.percentile一致）
+
+    Args:
+        a: 输入数组
+        percentiles: 百分位数（0-100）
+
+    Returns:
+        第0维对应各百分位数，与np.percentile(a, percentiles, axis=-1)形状相同
+    """
+    n = a.shape[-1]
+    positions = np.asarray(percentiles, dtype=np.float64) / 100 * (n - 1)
+    lower = np.floor(positions).astype(np.intp)
+    upper = np.minimum(lower + 1, n - 1)
+    partitioned = np.partition(a, np.unique(np.concatenate((lower, upper))), axis=-1)
+    low_values = partitioned[..., lower]
+    high_values = partitioned[..., upper]
+    result = low_values + (high_values - low_values) * (positions - lower)
+    return np.moveaxis(result, -1, 0)
+
+@dataclass(frozen=True)
+class BandTables:
+    """只与(sr, n_fft)相关、可在请求之间复用的频率表"""
+    a_weight_power: np.ndarray               # 各频率bin的A加权功率增益，形状(频率bin数, 1)
+    band_bins: slice                         # 频段覆盖的频率bin范围，之外的bin不参与频段计算
+    band_matrix: scipy.sparse.csr_matrix     # 1/3倍频程分配矩阵，形状(频段数, band_bins内的bin数)
+    bin_counts: np.ndarray                   # 每个频段包含的bin数
+
+@lru_cache(maxsize=32)
+def _band_tables(sr: int, n_fft: int) -> BandTables:
+    """
+    构建并缓存A加权功率增益和1/3倍频程频段分配矩阵
+
+    Args:
+        sr: 采样率
+        n_fft: FFT窗口大小
+
+    Returns:
+        BandTables，其中频段矩阵属于该频段的bin为1.0
+    """
+    freqs = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
+    # A加权为dB值，换算为功率增益 10^(dB/10)
+    a_weight_power = (10.0 ** (librosa.A_weighting(freqs) / 10.0)).astype(np.float32)[:, np.newaxis]
+    rows = []
+    cols = []
+    for band_idx, center_freq in enumerate(CENTER_FREQS):
+        # 计算1/3倍频程带宽
+        freq_min = center_freq / 2 ** (1/6)
+        freq_max = center_freq * 2 ** (1/6)
+        bins = np.flatnonzero((freqs >= freq_min) & (freqs < freq_max))
+        rows.append(np.full(len(bins), band_idx))
+        cols.append(bins)
+    rows = np.concatenate(rows)
+    cols = np.concatenate(cols)
+    # 只保留频段覆盖的bin范围，调用方先切片频谱再做矩阵乘法
+    band_bins = slice(int(cols.min()), int(cols.max()) + 1) if len(cols) else slice(0, 0)
+    band_matrix = scipy.sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols - band_bins.start)),
+        shape=(len(CENTER_FREQS), band_bins.stop - band_bins.start)
+    )
+    bin_counts = np.diff(band_matrix.indptr)
+    # 缓存结果在请求之间共享，设为只读防止被意外修改
+    for table in (a_weight_power, bin_counts):
+        table.flags.writeable = False
+    return BandTables(a_weight_power, band_bins, band_matrix, bin_counts)
+
+def analyze_dynamics(y: np.ndarray, sr: int, S: np.ndarray, a_weight_power: np.ndarray,
+                     n_fft: int, hop_length: int) -> Dict[str, Any]:
     """
     分析音频的动态范围，使用专业音响标准
     
     Args:
         y: 音频数据
         sr: 采样率
+        S: 功率谱（汉宁窗STFT）
+        a_weight_power: 各频率bin的A加权功率增益，形状(频率bin数, 1)
         n_fft: FFT窗口大小
         hop_length: 步长
         
     Returns:
         动态范围分析结果
     """
-    # 应用A加权滤波
-    frequencies = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
-    a_weighting = librosa.A_weighting(frequencies)
-    
-    # 计算短时傅里叶变换（使用汉宁窗）
-    D = librosa.stft(y, n_fft=n_fft, hop_length=hop_length, window='hann')
-    # 应用A加权到频谱上
-    D_weighted = D * np.exp(a_weighting[:, np.newaxis] / 20.0)
-    S = np.abs(D_weighted) ** 2
+    # 应用A加权到功率谱上（等价于|D * gain|^2，无需复数中间数组）
+    S = S * a_weight_power
     
     # 定义时间加权参数（Fast: 125ms, Slow: 1000ms）
     fast_time = 0.125  # 秒
     slow_time = 1.0    # 秒
     
-    # 计算时间加权的RMS能量
-    def time_weighted_rms(signal: np.ndarray, time_constant: float, sample_rate: int) -> np.ndarray:
-        alpha = np.exp(-hop_length / (time_constant * sample_rate))
-        weighted = np.zeros_like(signal)
-        weighted[0] = signal[0]
-        for i in range(1, len(signal)):
-            weighted[i] = alpha * weighted[i-1] + (1 - alpha) * signal[i]
-        return weighted
+    # 时间加权系数
+    alpha_fast = math.exp(-hop_length / (fast_time * sr))
+    alpha_slow = math.exp(-hop_length / (slow_time * sr))
     
     # 计算Fast和Slow时间加权的RMS
     rms = librosa.feature.rms(S=S, frame_length=n_fft)[0]
-    rms_fast = time_weighted_rms(rms, fast_time, sr)
-    rms_slow = time_weighted_rms(rms, slow_time, sr)
+    rms_fast = time_weighting(rms, alpha_fast)
+    rms_slow = time_weighting(rms, alpha_slow)
     
     # 转换为dB，考虑数字满刻度参考电平
     ref_level = 1.0
-    rms_fast_db = 20 * np.log10(np.maximum(rms_fast, 1e-10) / ref_level)
-    rms_slow_db = 20 * np.log10(np.maximum(rms_slow, 1e-10) / ref_level)
+    rms_fast_db = _to_db_inplace(rms_fast / ref_level, 20)
+    rms_slow_db = _to_db_inplace(rms_slow / ref_level, 20)
     
     # 计算真峰值电平（True Peak Level）
-    # 对原始信号进行A加权处理
-    y_weighted = librosa.istft(D_weighted, hop_length=hop_length, window='hann')
-    true_peak = librosa.feature.rms(y=librosa.resample(y_weighted, orig_sr=sr, target_sr=sr*4), 
-                                  frame_length=n_fft//4)[0]
-    true_peak_db = 20 * np.log10(np.maximum(np.max(true_peak), 1e-10))
+    # 过采样后进行时域A加权，取最大绝对值（ITU-R BS.1770）
+    true_peak, weighted_power = a_weighted_peak_and_power(y, sr)
+    true_peak_db = 20 * np.log10(max(true_peak, 1e-10))
     
     # 计算峰值因数（Crest Factor）
     crest_factor = true_peak_db - np.mean(rms_slow_db)
     
-    # 计算动态范围统计
-    def calculate_dynamics_stats(levels: np.ndarray) -> Dict[str, float]:
-        percentiles = np.percentile(levels, [10, 25, 50, 75, 90])
+    # 计算动态范围统计（输入为10/25/50/75/90百分位数）
+    def calculate_dynamics_stats(percentiles: np.ndarray) -> Dict[str, Any]:
         return {
             "range": float(percentiles[4] - percentiles[0]),  # 90th - 10th percentile
             "percentiles": {
@@ -74,65 +297,57 @@ def analyze_dynamics(y: np.ndarray, sr: int, n_fft: int, hop_length: int) -> Dic
             }
         }
     
-    # 定义1/3倍频程中心频率（ISO标准）
-    center_freqs = [
-        20, 25, 31.5, 40, 50, 63, 80, 100, 125, 160, 200, 250, 315, 400, 500,
-        630, 800, 1000, 1250, 1600, 2000, 2500, 3150, 4000, 5000, 6300, 8000,
-        10000, 12500, 16000, 20000
-    ]
+    # Fast/Slow整体电平的百分位数一次求出，结果形状为(5, 2)
+    overall_percentiles = quantiles(np.vstack([rms_fast_db, rms_slow_db]))
     
-    # 计算频段动态范围
-    freqs = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
-    band_dynamics = []
+    # 计算频段动态范围：一次稀疏矩阵乘法得到所有频段的逐帧能量
+    tables = _band_tables(sr, n_fft)
+    bin_counts = tables.bin_counts
+    band_energies = tables.band_matrix @ S[tables.band_bins]
+    bands_db = _to_db_inplace(band_energies, 10)
+    valid_bands = np.flatnonzero(bin_counts > 0)
     
-    for center_freq in center_freqs:
-        # 计算1/3倍频程带宽
-        freq_min = center_freq / 2 ** (1/6)
-        freq_max = center_freq * 2 ** (1/6)
+    # 对所有频段一次应用时间加权，结果形状为(2, 有效频段数, 帧数)
+    valid_bands_db = bands_db[valid_bands]
+    bands_weighted = np.stack([
+        time_weighting(valid_bands_db, alpha)
+        for alpha in (alpha_fast, alpha_slow)
+    ])
+    
+    # 所有频段的百分位数一次求出，结果形状为(5, 2, 有效频段数)
+    band_percentiles = quantiles(bands_weighted)
+    
+    band_dynamics = []
+    for i, band_idx in enumerate(valid_bands):
+        band_stats_fast = calculate_dynamics_stats(band_percentiles[:, 0, i])
+        band_stats_slow = calculate_dynamics_stats(band_percentiles[:, 1, i])
         
-        # 获取频段对应的频率bin索引
-        band_mask = (freqs >= freq_min) & (freqs < freq_max)
-        if np.any(band_mask):
-            # 计算该频段的能量
-            band_energy = np.sum(S[band_mask], axis=0)
-            band_db = 10 * np.log10(np.maximum(band_energy, 1e-10))
-            
-            # 应用时间加权
-            band_db_fast = time_weighted_rms(band_db, fast_time, sr)
-            band_db_slow = time_weighted_rms(band_db, slow_time, sr)
-            
-            # 计算该频段的动态范围统计
-            band_stats_fast = calculate_dynamics_stats(band_db_fast)
-            band_stats_slow = calculate_dynamics_stats(band_db_slow)
-            
-            band_dynamics.append({
-                "band": f"{center_freq}Hz",
-                "dynamic_range": {
-                    "fast": band_stats_fast["range"],
-                    "slow": band_stats_slow["range"]
-                },
-                "percentiles": {
-                    "fast": band_stats_fast["percentiles"],
-                    "slow": band_stats_slow["percentiles"]
-                }
-            })
+        band_dynamics.append({
+            "band": f"{CENTER_FREQS[band_idx]}Hz",
+            "dynamic_range": {
+                "fast": band_stats_fast["range"],
+                "slow": band_stats_slow["range"]
+            },
+            "percentiles": {
+                "fast": band_stats_fast["percentiles"],
+                "slow": band_stats_slow["percentiles"]
+            }
+        })
     
     # 计算短时动态范围（使用100ms窗口，符合EBU R128）
     frame_duration = 0.1  # 100ms
     frame_length = int(sr * frame_duration)
-    n_frames = len(y_weighted) // frame_length
+    n_frames = len(weighted_power) // frame_length
     
-    short_term_dynamics = []
-    for i in range(n_frames):
-        frame = y_weighted[i * frame_length:(i + 1) * frame_length]
-        frame_rms = np.sqrt(np.mean(frame ** 2))
-        frame_db = 20 * np.log10(np.maximum(frame_rms, 1e-10))
-        short_term_dynamics.append(float(frame_db))
+    frames = weighted_power[:n_frames * frame_length].reshape(n_frames, frame_length)
+    frame_rms = np.sqrt(frames.mean(axis=1))
+    frame_db = _to_db_inplace(frame_rms, 20)
+    short_term_dynamics = frame_db.tolist()
     
     return {
         "overall_dynamics": {
-            "fast": calculate_dynamics_stats(rms_fast_db),
-            "slow": calculate_dynamics_stats(rms_slow_db)
+            "fast": calculate_dynamics_stats(overall_percentiles[:, 0]),
+            "slow": calculate_dynamics_stats(overall_percentiles[:, 1])
         },
         "true_peak_level": float(true_peak_db),
         "crest_factor": float(crest_factor),
@@ -143,63 +358,34 @@ def analyze_dynamics(y: np.ndarray, sr: int, n_fft: int, hop_length: int) -> Dic
         }
     }
 
-def calculate_frequency_response(y: np.ndarray, sr: int, n_fft: int = 2048, hop_length: int = None) -> Dict[str, Any]:
+def calculate_frequency_response(S: np.ndarray, sr: int, n_fft: int) -> Dict[str, Any]:
     """
     计算音频的频率响应
     使用1/3倍频程分析方法
     
     Args:
-        y: 音频数据
+        S: 功率谱
         sr: 采样率
         n_fft: FFT窗口大小
-        hop_length: 步长
         
     Returns:
         频率响应数据
     """
-    if hop_length is None:
-        hop_length = n_fft // 4
-
-    # 计算短时傅里叶变换
-    D = librosa.stft(y, n_fft=n_fft, hop_length=hop_length, window='hann')
-    
-    # 计算功率谱
-    S = np.abs(D) ** 2
-    
-    # 获取频率数组
-    freqs = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
-    
-    # 定义1/3倍频程中心频率（ISO标准）
-    center_freqs = [
-        20, 25, 31.5, 40, 50, 63, 80, 100, 125, 160, 200, 250, 315, 400, 500,
-        630, 800, 1000, 1250, 1600, 2000, 2500, 3150, 4000, 5000, 6300, 8000,
-        10000, 12500, 16000, 20000
-    ]
-    
-    # 计算每个频带的能量
-    band_energies = []
-    for center_freq in center_freqs:
-        # 计算频带的上下限（1/3倍频程）
-        freq_min = center_freq / 2 ** (1/6)
-        freq_max = center_freq * 2 ** (1/6)
-        
-        # 找到对应的频率bin
-        mask = (freqs >= freq_min) & (freqs < freq_max)
-        if np.any(mask):
-            # 计算该频带的平均能量
-            band_energy = np.mean(S[mask], axis=0)
-            # 转换为dB，并取时间平均
-            band_energy_db = 10 * np.log10(np.maximum(np.mean(band_energy), 1e-10))
-            band_energies.append(band_energy_db)
-        else:
-            band_energies.append(float('-inf'))
+    # 计算每个频带的能量：只对频段覆盖的bin按时间取平均，再用频段矩阵一次求出各频带的bin平均
+    tables = _band_tables(sr, n_fft)
+    bin_counts = tables.bin_counts
+    band_sums = tables.band_matrix @ np.mean(S[tables.band_bins], axis=1)
+    valid_bands = bin_counts > 0
+    band_energies = np.full(len(CENTER_FREQS), float('-inf'))
+    band_energies[valid_bands] = 10 * np.log10(
+        np.maximum(band_sums[valid_bands] / bin_counts[valid_bands], 1e-10)
+    )
     
     # 将能量值转换为相对值（归一化）
-    band_energies = np.array(band_energies)
     valid_energies = band_energies[band_energies > float('-inf')]
     if len(valid_energies) > 0:
         # 使用1kHz频率作为参考点（通常的标准做法）
-        ref_idx = center_freqs.index(1000)
+        ref_idx = CENTER_FREQS.index(1000)
         ref_energy = band_energies[ref_idx]
         relative_response = band_energies - ref_energy
         
@@ -218,68 +404,143 @@ def calculate_frequency_response(y: np.ndarray, sr: int, n_fft: int = 2048, hop_
     }
     
     return {
-        "frequencies": center_freqs,
+        "frequencies": CENTER_FREQS,
         "magnitudes": relative_response.tolist(),
         "stats": response_stats
     }
 
-def analyze_audio(file_content: bytes) -> Dict[str, Any]:
+def probe_duration(file_content: bytes) -> Optional[float]:
     """
-    分析音频文件并返回频响数据
+    只读取文件头获取音频时长，无需解码整个文件
     
     Args:
         file_content: 音频文件的二进制内容
         
     Returns:
-        包含频率和幅度数据的字典
+        时长（秒）；soundfile无法解析文件头的格式返回None
     """
     try:
+        info = sf.info(io.BytesIO(file_content))
+    except sf.SoundFileRuntimeError:
+        return None
+    return info.frames / info.samplerate
+
+def load_audio(file_content: bytes, file_ext: str) -> Tuple[np.ndarray, int]:
+    """
+    解码音频文件内容
+    优先直接从内存解码；soundfile不支持的格式（如m4a/aac）回退为临时文件交给audioread
+    
+    Args:
+        file_content: 音频文件的二进制内容
+        file_ext: 文件扩展名（不含点）
+        
+    Returns:
+        (y, sr)：float32单声道音频数据和原始采样率
+    """
+    try:
+        y, sr = librosa.load(io.BytesIO(file_content), sr=None)
+    except sf.SoundFileRuntimeError:
         # 创建临时文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_file:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=f'.{file_ext}') as temp_file:
             temp_file.write(file_content)
             temp_file_path = temp_file.name
-
+        
         try:
-            # 加载音频文件
             y, sr = librosa.load(temp_file_path, sr=None)
-            
-            # 设置分析参数
-            n_fft = 8192  # 更大的FFT窗口以获得更好的频率分辨率
-            hop_length = n_fft // 4
-            
-            # 计算RMS能量
-            rms = librosa.feature.rms(y=y, frame_length=n_fft, hop_length=hop_length)[0]
-            
-            # 设置能量门限值
-            threshold_db = -60  # 更低的门限值以捕获更多细节
-            threshold_linear = 10 ** (threshold_db / 20)
-            
-            # 找出高于门限值的帧
-            active_frames = rms > threshold_linear
-            
-            if not np.any(active_frames):
-                raise Exception("未检测到有效音频信号")
-            
-            # 计算频响
-            frequency_response = calculate_frequency_response(y, sr, n_fft, hop_length)
-            
-            # 计算动态范围
-            dynamics_data = analyze_dynamics(y, sr, n_fft, hop_length)
-            
-            return {
-                "frequencies": frequency_response["frequencies"],
-                "magnitudes": frequency_response["magnitudes"],
-                "frequency_response_stats": frequency_response["stats"],
-                "sample_rate": sr,
-                "analysis_points": len(frequency_response["frequencies"]),
-                "active_frames_ratio": float(np.mean(active_frames)),
-                "dynamics": dynamics_data
-            }
-            
         finally:
             # 清理临时文件
             os.unlink(temp_file_path)
+    
+    return y.astype(np.float32, copy=False), sr
+
+def analyze_file(filename: str, file_ext: str, content: bytes, max_duration: float) -> Dict[str, Any]:
+    """
+    检查单个文件的音频长度并进行分析（作为进程池工作进程的入口）
+    
+    Args:
+        filename: 文件名
+        file_ext: 文件扩展名（不含点）
+        content: 音频文件的二进制内容
+        max_duration: 最长音频时间限制（秒）
+        
+    Returns:
+        成功时包含filename和data，超出长度限制时包含filename和message
+    """
+    too_long = {
+        "filename": filename,
+        "message": f"音频长度超过限制。最大允许长度：{max_duration}秒"
+    }
+    
+    # 先读取文件头检查音频长度，超长文件无需解码
+    duration = probe_duration(content)
+    if duration is not None and duration > max_duration:
+        return too_long
+    
+    # 解码一次，分析直接使用解码结果
+    y, sr = load_audio(content, file_ext)
+    
+    # 文件头无法解析的格式（如m4a/aac）只能在解码后检查音频长度
+    if duration is None and librosa.get_duration(y=y, sr=sr) > max_duration:
+        return too_long
+    
+    # 分析音频
+    return {
+        "filename": filename,
+        "data": analyze_audio(y, sr)
+    }
+
+def analyze_audio(y: np.ndarray, sr: int) -> Dict[str, Any]:
+    """
+    分析音频数据并返回频响数据
+    
+    Args:
+        y: 音频数据
+        sr: 采样率
+        
+    Returns:
+        包含频率和幅度数据的字典
+    """
+    try:
+        y = y.astype(np.float32, copy=False)
+        
+        # 设置分析参数
+        n_fft = 8192  # 更大的FFT窗口以获得更好的频率分辨率
+        hop_length = n_fft // 4
+        
+        # 计算RMS能量
+        rms = librosa.feature.rms(y=y, frame_length=n_fft, hop_length=hop_length)[0]
+        
+        # 设置能量门限值
+        threshold_db = -60  # 更低的门限值以捕获更多细节
+        threshold_linear = 10 ** (threshold_db / 20)
+        
+        # 找出高于门限值的帧
+        active_frames = rms > threshold_linear
+        
+        if not np.any(active_frames):
+            raise Exception("未检测到有效音频信号")
+        
+        # 计算短时傅里叶变换（频响与动态分析共用）
+        # 只保留功率谱，不让两倍大小的复数频谱在后续分析期间一直占用内存
+        S = power_spectrum(fast_stft(y, n_fft, hop_length))
+        tables = _band_tables(sr, n_fft)
+        
+        # 计算频响
+        frequency_response = calculate_frequency_response(S, sr, n_fft)
+        
+        # 计算动态范围
+        dynamics_data = analyze_dynamics(y, sr, S, tables.a_weight_power, n_fft, hop_length)
+        
+        return {
+            "frequencies": frequency_response["frequencies"],
+            "magnitudes": frequency_response["magnitudes"],
+            "frequency_response_stats": frequency_response["stats"],
+            "sample_rate": sr,
+            "analysis_points": len(frequency_response["frequencies"]),
+            "active_frames_ratio": float(np.mean(active_frames)),
+            "dynamics": dynamics_data
+        }
             
     except Exception as e:
-        print(f"Analysis error details: {str(e)}")
+        logger.error("Analysis error details: %s", e)
         raise Exception(f"音频分析失败: {str(e)}") 
\ No newline at end of file
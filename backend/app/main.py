@@ -1,13 +1,29 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from app.analyzer import analyze_audio
+from app.analyzer import analyze_file
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional
 import yaml
 from pathlib import Path
-import tempfile
-import librosa
+import asyncio
+import multiprocessing
 import os
 
-app = FastAPI(title="音频频响分析服务")
+# 分析进程池，在应用生命周期内创建和关闭
+EXECUTOR: Optional[ProcessPoolExecutor] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global EXECUTOR
+    EXECUTOR = _create_executor()
+    try:
+        yield
+    finally:
+        EXECUTOR.shutdown()
+
+app = FastAPI(title="音频频响分析服务", lifespan=lifespan)
 
 # 配置CORS
 app.add_middleware(
@@ -30,6 +46,31 @@ with open(config_path, "r", encoding="utf-8") as f:
 MAX_AUDIO_DURATION = config["audio"]["max_duration"]
 MAX_FILES = config["audio"]["max_files"]
 
+# 分析为CPU密集型任务且单个文件可能占用数GB内存，使用固定上限的进程池
+MAX_WORKERS = min(config["audio"]["max_workers"], os.cpu_count() or 1)
+
+def _create_executor() -> ProcessPoolExecutor:
+    # 工作进程以spawn方式启动：服务进程运行着事件循环和线程，fork可能复制出
+    # 被其他线程持有的锁而死锁；spawn的工作进程只导入app.analyzer
+    return ProcessPoolExecutor(max_workers=MAX_WORKERS,
+                               mp_context=multiprocessing.get_context("spawn"))
+
+async def _run_analysis(filename: str, file_ext: str, content: bytes) -> Dict[str, Any]:
+    """在进程池中检查音频长度并分析单个文件"""
+    global EXECUTOR
+    executor = EXECUTOR
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(
+            executor, analyze_file, filename, file_ext, content, MAX_AUDIO_DURATION
+        )
+    except BrokenProcessPool as e:
+        # 工作进程异常退出（如内存不足被杀）后进程池不可再用，重建以免影响后续请求
+        if EXECUTOR is executor:
+            EXECUTOR = _create_executor()
+            executor.shutdown(wait=False)
+        raise Exception("音频分析进程异常退出，可能是文件过大导致内存不足") from e
+
 @app.get("/config")
 async def get_config():
     """获取应用配置"""
@@ -61,35 +102,20 @@ async def analyze_audio_file(file: UploadFile = File(...)):
         # 读取文件内容
         content = await file.read()
         
-        # 创建临时文件来检查音频长度
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f'.{file_ext}') as temp_file:
-            temp_file.write(content)
-            temp_file_path = temp_file.name
-
-        try:
-            # 使用librosa读取音频文件
-            y, sr = librosa.load(temp_file_path, sr=None)
-            duration = librosa.get_duration(y=y, sr=sr)
-            
-            # 检查音频长度
-            if duration > MAX_AUDIO_DURATION:
-                return {
-                    "status": "error",
-                    "message": f"音频长度超过限制。最大允许长度：{MAX_AUDIO_DURATION}秒"
-                }
-            
-            # 分析音频
-            result = analyze_audio(content)
-            
+        # 在进程池中检查音频长度并分析，不阻塞事件循环
+        outcome = await _run_analysis(file.filename, file_ext, content)
+        
+        if "data" not in outcome:
             return {
-                "status": "success",
-                "filename": file.filename,
-                "data": result
+                "status": "error",
+                "message": outcome["message"]
             }
-            
-        finally:
-            # 清理临时文件
-            os.unlink(temp_file_path)
+        
+        return {
+            "status": "success",
+            "filename": file.filename,
+            "data": outcome["data"]
+        }
             
     except Exception as e:
         return {
@@ -107,14 +133,15 @@ async def upload_files(files: list[UploadFile]):
                 "message": f"一次最多只能上传{MAX_FILES}个文件"
             }
         
-        results = []
-        errors = []
+        # 按上传顺序记录每个文件的结果，待分析的文件先占位
+        outcomes = []
+        pending = []
         
         for file in files:
             # 检查文件扩展名
             file_ext = file.filename.lower().split('.')[-1]
             if f'.{file_ext}' not in SUPPORTED_EXTENSIONS:
-                errors.append({
+                outcomes.append({
                     "filename": file.filename,
                     "message": f"不支持的文件格式。支持的格式：{', '.join(SUPPORTED_EXTENSIONS)}"
                 })
@@ -122,35 +149,19 @@ async def upload_files(files: list[UploadFile]):
             
             # 读取文件内容
             content = await file.read()
-            
-            # 创建临时文件来检查音频长度
-            with tempfile.NamedTemporaryFile(delete=False, suffix=f'.{file_ext}') as temp_file:
-                temp_file.write(content)
-                temp_file_path = temp_file.name
-
-            try:
-                # 使用librosa读取音频文件
-                y, sr = librosa.load(temp_file_path, sr=None)
-                duration = librosa.get_duration(y=y, sr=sr)
-                
-                # 检查音频长度
-                if duration > MAX_AUDIO_DURATION:
-                    errors.append({
-                        "filename": file.filename,
-                        "message": f"音频长度超过限制。最大允许长度：{MAX_AUDIO_DURATION}秒"
-                    })
-                    continue
-                
-                # 分析音频
-                result = analyze_audio(content)
-                results.append({
-                    "filename": file.filename,
-                    "data": result
-                })
-                
-            finally:
-                # 清理临时文件
-                os.unlink(temp_file_path)
+            pending.append((len(outcomes), file.filename, file_ext, content))
+            outcomes.append(None)
+        
+        # 在进程池中并行分析所有文件
+        analyzed = await asyncio.gather(*[
+            _run_analysis(filename, file_ext, content)
+            for _, filename, file_ext, content in pending
+        ])
+        for (index, *_), outcome in zip(pending, analyzed):
+            outcomes[index] = outcome
+        
+        results = [outcome for outcome in outcomes if "data" in outcome]
+        errors = [outcome for outcome in outcomes if "data" not in outcome]
         
         return {
             "status": "success" if not errors else "partial",